@@ -1,56 +1,115 @@
 import os
+import asyncio
 import time
-import threading
+import sys
+import queue
 import json
-from flask import Flask, request
-from slack_bolt import App as SlackBoltApp
-from slack_bolt.adapter.flask import SlackRequestHandler
-from slack_sdk.web import WebClient
+from contextlib import asynccontextmanager
+import aiohttp
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.routing import Route
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.starlette.async_handler import AsyncSlackRequestHandler
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+from slack_sdk.errors import SlackApiError
+from slack_sdk.http_retry.builtin_async_handlers import AsyncRateLimitErrorRetryHandler, async_default_handlers
+from slack_sdk.web.async_client import AsyncWebClient
 from dotenv import load_dotenv
 import logging
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.executors.pool import ThreadPoolExecutor
-from datetime import datetime
-from pytz import utc
-from threading import Lock
+import logging.handlers
+import uvicorn
+import uvloop
+from datetime import datetime, timedelta, timezone
+from threading import Event, Lock, Thread
 
 load_dotenv()
 
-# Initialize logging
-logging.basicConfig(level=logging.INFO)
+# Initialize logging; records are queued and written to stdout by a listener
+# thread so handlers never block on a slow log pipe
+log_queue = queue.SimpleQueue()
+root_logger = logging.getLogger()
+root_logger.setLevel(logging.INFO)
+root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+stream_handler = logging.StreamHandler(sys.stdout)
+stream_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+log_listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+log_listener.start()
 logger = logging.getLogger(__name__)
 
-# Initialize the Slack Bolt app
-bolt_app = SlackBoltApp(
-    token=os.environ.get("SLACK_BOT_TOKEN"),
-    signing_secret=os.environ.get("SLACK_SIGNING_SECRET")
+# Read the bot token once for both the shared client and the Bolt app
+SLACK_BOT_TOKEN = os.environ.get("SLACK_BOT_TOKEN")
+
+# App-level token; when set, `python app.py` connects over Socket Mode instead of HTTP
+SLACK_APP_TOKEN = os.environ.get("SLACK_APP_TOKEN")
+
+# Shared Slack Web API client; its pooled HTTP session is opened on startup.
+# Rate-limited calls (429) are retried after the Retry-After delay Slack sends.
+slack_client = AsyncWebClient(
+    token=SLACK_BOT_TOKEN,
+    retry_handlers=async_default_handlers() + [AsyncRateLimitErrorRetryHandler(max_retry_count=3)]
 )
 
-# Initialize the Flask app
-app = Flask(__name__)
+# Initialize the Slack Bolt app
+bolt_app = AsyncApp(
+    token=SLACK_BOT_TOKEN,
+    signing_secret=os.environ.get("SLACK_SIGNING_SECRET"),
+    # Respond to Slack only after ack(); the real work runs in lazy listeners
+    process_before_response=True
+)
 
 # Create the Slack request handler
-handler = SlackRequestHandler(bolt_app)
+handler = AsyncSlackRequestHandler(bolt_app)
 
-# List of team members' Slack user IDs
-team_members = [
+# Rotation of team members' Slack user IDs (fixed order, never mutated)
+team_members = (
     "U07GAGKL6SY",  # Damian
     "U04JZU760AD",  # Sopio
     "U06Q83GFMNW",  # Phil
     "U07H9H7L7K8",  # Rafa
     "U041EHKCD3K",  # Martin
     "U062AK6DQP9",  # Akash
-]
+)
 
 # File to store the current index
 STATE_FILE = 'rotation_state.json'
 state_lock = Lock()
 
+# fsync state writes; set STATE_FSYNC=false for local development
+STATE_FSYNC = os.environ.get("STATE_FSYNC", "true").lower() == "true"
+
 # Channel where the reminders will be posted
 channel_id = "C087GGL7EMT"  # Replace with your channel ID
 
+# Skip clicks on the same version of a message (same assignee shown) within this
+# window advance the rotation only once
+SKIP_DEDUP_SECONDS = 10
+recent_skips = {}  # (channel ID, message ts, assignee) -> monotonic time of the skip
+
+# Button definitions never change; only the Confirm value varies per message
+CONFIRM_BUTTON = {
+    "type": "button",
+    "text": {
+        "type": "plain_text",
+        "text": "Confirm"
+    },
+    "style": "primary",
+    "action_id": "confirm_action"
+}
+
+SKIP_BUTTON = {
+    "type": "button",
+    "text": {
+        "type": "plain_text",
+        "text": "Skip"
+    },
+    "style": "danger",
+    "action_id": "skip_action",
+    "value": "skip"
+}
+
 def get_message_blocks(message_text, assigned_user_id):
-    return [
+    return (
         {
             "type": "section",
             "text": {
@@ -61,82 +120,183 @@ def get_message_blocks(message_text, assigned_user_id):
         {
             "type": "actions",
             "elements": [
-                {
-                    "type": "button",
-                    "text": {
-                        "type": "plain_text",
-                        "text": "Confirm"
-                    },
-                    "style": "primary",
-                    "action_id": "confirm_action",
-                    "value": assigned_user_id  # Pass the assigned user's ID here
-                },
-                {
-                    "type": "button",
-                    "text": {
-                        "type": "plain_text",
-                        "text": "Skip"
-                    },
-                    "style": "danger",
-                    "action_id": "skip_action",
-                    "value": "skip"
-                }
+                {**CONFIRM_BUTTON, "value": assigned_user_id},  # Pass the assigned user's ID here
+                SKIP_BUTTON
             ]
         }
-    ]
+    )
 
-def load_state():
-    with state_lock:
-        if os.path.exists(STATE_FILE):
-            with open(STATE_FILE, 'r') as f:
-                state = json.load(f)
-                return state.get('current_index', 0)
+# Reminder and skip messages depend only on the rotation index, so all of them
+# are rendered once here; slack_sdk never mutates the blocks it is given.
+# The texts double as notification previews and screen-reader fallbacks.
+REMINDER_TEXTS = tuple(
+    f"<@{user_id}> is responsible for #devops_support today."
+    for user_id in team_members
+)
+
+REMINDER_BLOCKS = tuple(
+    get_message_blocks(message_text, user_id)
+    for message_text, user_id in zip(REMINDER_TEXTS, team_members)
+)
+
+SKIP_TEXTS = tuple(
+    f"<@{user_id}> is unavailable. <@{next_user_id}> is now responsible for #devops_support today."
+    for user_id, next_user_id in zip(team_members, team_members[1:] + team_members[:1])
+)
+
+SKIP_BLOCKS = tuple(
+    get_message_blocks(message_text, next_user_id)
+    for message_text, next_user_id in zip(SKIP_TEXTS, team_members[1:] + team_members[:1])
+)
+
+def read_state_from_disk():
+    try:
+        with open(STATE_FILE, 'r') as f:
+            data = f.read().strip()
+    except FileNotFoundError:
+        return 0
+    try:
+        # Older deployments stored {"current_index": N}
+        if data.startswith('{'):
+            current_index = json.loads(data).get('current_index', 0)
         else:
-            return 0
+            current_index = int(data)
+    except ValueError:
+        current_index = None
+    # An empty, corrupt or out-of-range value must not keep reminders from going out
+    if not (isinstance(current_index, int) and not isinstance(current_index, bool)
+            and 0 <= current_index < len(team_members)):
+        logger.warning("Invalid rotation state %r in %s, starting from index 0", data, STATE_FILE)
+        return 0
+    return current_index
+
+# The file is only read once at startup; afterwards memory is authoritative.
+# state_lock serializes writers only: the index is swapped with a single dict
+# assignment, so readers always see a whole value and never need the lock.
+rotation_state = {'current_index': read_state_from_disk()}
+
+def load_state():
+    return rotation_state['current_index']
+
+def write_state_to_disk(current_index):
+    # Write the bare index to a temp file and rename it over the state file.
+    # The temp file must stay next to STATE_FILE: os.replace is only atomic
+    # within one filesystem.
+    tmp_file = f"{STATE_FILE}.tmp.{os.getpid()}"
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, str(current_index).encode())
+        if STATE_FSYNC:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp_file, STATE_FILE)
 
-def save_state(current_index):
+    # fsync the directory too, otherwise the rename itself may not survive a crash
+    if STATE_FSYNC:
+        try:
+            dir_fd = os.open(os.path.dirname(os.path.abspath(STATE_FILE)), os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError as e:
+            logger.warning("Could not fsync state directory: %s", e)
+
+# The state file is written by a background thread so fsync never blocks the
+# event loop; advances made while a write is in flight collapse into one write
+state_dirty = Event()
+state_writer_stop = Event()
+
+def state_writer():
+    written_index = rotation_state['current_index']
+    while True:
+        state_dirty.wait()
+        state_dirty.clear()
+        stopping = state_writer_stop.is_set()
+        current_index = rotation_state['current_index']
+        if current_index != written_index:
+            try:
+                write_state_to_disk(current_index)
+                written_index = current_index
+            except OSError as e:
+                logger.error("Error writing rotation state: %s", e)
+        if stopping:
+            return
+
+state_writer_thread = Thread(target=state_writer, name="state-writer", daemon=True)
+state_writer_thread.start()
+
+def stop_state_writer():
+    # Flush the latest index before the process exits
+    state_writer_stop.set()
+    state_dirty.set()
+    state_writer_thread.join()
+
+def step_rotation():
+    # Advance to the next person in a single critical section
     with state_lock:
-        with open(STATE_FILE, 'w') as f:
-            json.dump({'current_index': current_index}, f)
+        current_index = rotation_state['current_index']
+        next_index = (current_index + 1) % len(team_members)
+        rotation_state['current_index'] = next_index
+    state_dirty.set()
+    return current_index, next_index
 
-def send_reminder():
+async def send_reminder():
     try:
         # Load current index
         current_index = load_state()
         user_id = team_members[current_index]
-        client = WebClient(token=os.environ.get("SLACK_BOT_TOKEN"))
-
-        message_text = f"<@{user_id}> is responsible for #devops_support today."
 
         # Message with Confirm and Skip buttons
-        client.chat_postMessage(
+        await slack_client.chat_postMessage(
             channel=channel_id,
-            text=message_text,
-            blocks=get_message_blocks(message_text, user_id)
+            text=REMINDER_TEXTS[current_index],
+            blocks=REMINDER_BLOCKS[current_index]
         )
-        logger.info(f"Sent reminder to {user_id}")
+        logger.info("Sent reminder to %s", user_id)
 
-        # Advance to the next index for testing purposes
-        next_index = (current_index + 1) % len(team_members)
-        save_state(next_index)
+        # Advance from the latest index, not the one read before the await,
+        # so a Skip handled while the message was being posted is not lost
+        step_rotation()
 
-    except Exception as e:
-        logger.error(f"Error in send_reminder: {e}")
+    except SlackApiError as e:
+        logger.error("Error in send_reminder: %s", e)
 
 
-# Initialize the scheduler
-scheduler = BackgroundScheduler(
-    executors={'default': ThreadPoolExecutor(1)},
-    timezone=utc
-)
+# Reminders go out at 08:00 UTC, Monday to Friday
+REMINDER_HOUR = 8
+
+def next_reminder_time(now):
+    run_at = now.replace(hour=REMINDER_HOUR, minute=0, second=0, microsecond=0)
+    if run_at <= now:
+        run_at += timedelta(days=1)
+    while run_at.weekday() >= 5:
+        run_at += timedelta(days=1)
+    return run_at
+
+async def run_reminder_schedule():
+    last_run_at = None
+    while True:
+        # Never schedule at or before the last run, even if the clock stepped back
+        now = datetime.now(timezone.utc)
+        run_at = next_reminder_time(max(now, last_run_at) if last_run_at else now)
+        last_run_at = run_at
+        # Sleep until the fire time, re-checking in case the wall clock moved meanwhile
+        while (delay := (run_at - datetime.now(timezone.utc)).total_seconds()) > 0:
+            await asyncio.sleep(delay)
+        try:
+            await send_reminder()
+        except Exception:
+            # Keep the schedule alive for the next weekday
+            logger.exception("Unexpected error while sending the reminder")
 
-# Schedule the send_reminder function to run every 1 minute for testing
-scheduler.add_job(send_reminder, 'cron', day_of_week='mon-fri', hour=8, minute=0)
+# Acknowledge button clicks right away so Slack gets its response within 3 seconds
+async def ack_action(ack):
+    await ack()
 
 # Handle the Confirm button action
-@bolt_app.action("confirm_action")
-def handle_confirm_action(ack, body, client, logger):
-    ack()
+async def handle_confirm_action(body, logger):
     try:
         user_id_clicked = body["user"]["id"]
         assigned_user_id = body["actions"][0]["value"]  # The assigned user's ID from the button value
@@ -145,7 +305,7 @@ def handle_confirm_action(ack, body, client, logger):
             # Update the message to indicate confirmation
             message_text = f"<@{user_id_clicked}> has confirmed #devops_support for today :meow_salute:"
 
-            client.chat_update(
+            await slack_client.chat_update(
                 channel=body["channel"]["id"],
                 ts=body["message"]["ts"],
                 text=message_text,
@@ -159,57 +319,104 @@ def handle_confirm_action(ack, body, client, logger):
                     }
                 ]
             )
-            logger.info(f"{user_id_clicked} confirmed responsibility.")
+            logger.info("%s confirmed responsibility.", user_id_clicked)
         else:
             # Send an ephemeral message to the user who tried to confirm
-            client.chat_postEphemeral(
+            await slack_client.chat_postEphemeral(
                 channel=body["channel"]["id"],
                 user=user_id_clicked,
                 text="Sorry, only the assigned user can confirm this task."
             )
-            logger.info(f"{user_id_clicked} attempted to confirm but is not the assigned user.")
-    except Exception as e:
-        logger.error(f"Error in handle_confirm_action: {e}")
+            logger.info("%s attempted to confirm but is not the assigned user.", user_id_clicked)
+    except SlackApiError as e:
+        logger.error("Error in handle_confirm_action: %s", e)
+
+def get_shown_assignee(message):
+    # chat_update keeps the message ts, so the Confirm value tells versions apart
+    for block in message.get("blocks", []):
+        for element in block.get("elements", []):
+            if element.get("action_id") == "confirm_action":
+                return element.get("value")
+    return None
+
+def is_repeated_skip(channel, message_ts, assignee):
+    # Lazy listeners run on the event loop, so check-and-record needs no lock
+    now = time.monotonic()
+    for key, skipped_at in list(recent_skips.items()):
+        if now - skipped_at > SKIP_DEDUP_SECONDS:
+            del recent_skips[key]
+    key = (channel, message_ts, assignee)
+    if key in recent_skips:
+        return True
+    recent_skips[key] = now
+    return False
 
 # Handle the Skip button action
-@bolt_app.action("skip_action")
-def handle_skip_action(ack, body, client, logger):
-    ack()
+async def handle_skip_action(body, logger):
     try:
-        # Load current index
-        current_index = load_state()
-        current_user_id = team_members[current_index]
+        assignee = get_shown_assignee(body["message"])
+        if is_repeated_skip(body["channel"]["id"], body["message"]["ts"], assignee):
+            logger.info("Ignoring repeated skip on message %s", body["message"]["ts"])
+            return
 
         # Move to the next person
-        next_index = (current_index + 1) % len(team_members)
+        current_index, next_index = step_rotation()
+        current_user_id = team_members[current_index]
         next_user_id = team_members[next_index]
 
-        # Save the new index
-        save_state(next_index)
-
-        # Create the updated message text
-        message_text = f"<@{current_user_id}> is unavailable. <@{next_user_id}> is now responsible for #devops_support today."
-
         # Update the original message to indicate skipping
-        client.chat_update(
+        await slack_client.chat_update(
             channel=body["channel"]["id"],
             ts=body["message"]["ts"],
-            text=message_text,
-            blocks=get_message_blocks(message_text, next_user_id)
+            text=SKIP_TEXTS[current_index],
+            blocks=SKIP_BLOCKS[current_index]
         )
-        logger.info(f"{current_user_id} skipped. Assigned to {next_user_id}.")
-    except Exception as e:
-        logger.error(f"Error in handle_skip_action: {e}")
+        logger.info("%s skipped. Assigned to %s.", current_user_id, next_user_id)
+    except SlackApiError as e:
+        logger.error("Error in handle_skip_action: %s", e)
 
-# Flask route to handle Slack requests
-@app.route("/slack/events", methods=["POST"])
-def slack_events():
-    return handler.handle(request)
+bolt_app.action("confirm_action")(ack=ack_action, lazy=[handle_confirm_action])
+bolt_app.action("skip_action")(ack=ack_action, lazy=[handle_skip_action])
 
-if __name__ == "__main__":
-    # Start the scheduler
-    scheduler.start()
+# Route that hands Slack requests straight to Bolt
+async def slack_events(req: Request):
+    return await handler.handle(req)
 
-    # Run the Flask app
-    app.run(host="0.0.0.0", port=3000)
+@asynccontextmanager
+async def lifespan(app):
+    # Keep connections to slack.com alive across reminders and button clicks
+    # slack_sdk does not apply its own timeout to a supplied session, so set it here
+    slack_client.session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=16),
+        timeout=aiohttp.ClientTimeout(total=slack_client.timeout)
+    )
+    # Start the reminder schedule once the event loop is running
+    reminder_task = asyncio.create_task(run_reminder_schedule())
+    try:
+        yield
+    finally:
+        # Runs on Ctrl-C and cancellation too, so the last index is always flushed
+        reminder_task.cancel()
+        stop_state_writer()
+        await slack_client.session.close()
+        log_listener.stop()
+
+# Initialize the ASGI app
+app = Starlette(
+    routes=[Route("/slack/events", slack_events, methods=["POST"])],
+    lifespan=lifespan
+)
+
+async def run_socket_mode():
+    async with lifespan(app):
+        await AsyncSocketModeHandler(bolt_app, SLACK_APP_TOKEN).start_async()
+
+if __name__ == "__main__":
+    if SLACK_APP_TOKEN:
+        # Receive events over a Socket Mode websocket; no inbound HTTP listener needed
+        uvloop.install()
+        asyncio.run(run_socket_mode())
+    else:
+        # Run the ASGI app for local development; the container starts uvicorn directly
+        uvicorn.run(app, host="0.0.0.0", port=3000, loop="uvloop", http="httptools")
 